@@ -1,31 +1,28 @@
 import krasue.krasue as ks
-import time
 
 class Game(ks.Invocation):
 
-    
+
     def __init__(self, width: int, height: int):
-        
+
         super().__init__(width, height)
         self.set_clear_color((32, 64, 64))
 
         # timing
-        self.last_time = time.time()
-        self.current_time = time.time()
+        self.accumulated_time = 0.0
         self.fps = 0
 
     def on_update(self) -> None:
 
-        self.current_time = time.time()
-        delta = self.current_time - self.last_time
-        if (delta > 1):
-            self.set_title(f"framerate: {int(self.fps / delta)}")
+        self.accumulated_time += self.delta
+        if (self.accumulated_time > 1):
+            self.set_title(f"framerate: {int(self.fps / self.accumulated_time)}")
             self.fps = 0
-            self.last_time = self.current_time
+            self.accumulated_time = 0.0
 
     def on_draw(self) -> None:
 
         self.fps += 1
 
 game = Game(1280, 800)
-game.run()
\ No newline at end of file
+game.run()
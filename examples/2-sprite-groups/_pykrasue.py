@@ -1,5 +1,4 @@
 import krasue.krasue as ks
-import time
 import numpy as np
 
 IMAGE_NAMES = (
@@ -18,8 +17,7 @@ class Game(ks.Invocation):
         self.set_clear_color((32, 64, 64))
 
         # timing
-        self.last_time = time.time()
-        self.current_time = time.time()
+        self.accumulated_time = 0.0
         self.fps = 0
 
         images = []
@@ -29,24 +27,24 @@ class Game(ks.Invocation):
         
         self.sprite_group = ks.SpriteGroup(self)
         object_count = 128
-        for i in range(object_count):
-            x = np.random.randint(0, 1280)
-            y = np.random.randint(0, 800)
-            scale = np.random.uniform(0.05, 0.15)
-            theta = np.random.randint(0, 360)
-            object_type = images[np.random.randint(0, len(IMAGE_NAMES))]
-            self.sprite_group.add(object_type, x, y, scale, theta)
+        object_types = np.asarray(images, dtype=np.uint32)[
+            np.random.randint(0, len(images), object_count)]
+        transforms = np.empty((object_count, 4), dtype=np.float32)
+        transforms[:, 0] = np.random.randint(0, 1280, object_count)
+        transforms[:, 1] = np.random.randint(0, 800, object_count)
+        transforms[:, 2] = np.random.uniform(0.05, 0.15, object_count)
+        transforms[:, 3] = np.random.randint(0, 360, object_count)
+        self.sprite_group.add_batch(object_types, transforms)
         self.sprite_group.inscribe()
 
 
     def on_update(self) -> None:
 
-        self.current_time = time.time()
-        delta = self.current_time - self.last_time
-        if (delta > 1):
-            self.set_title(f"framerate: {int(self.fps / delta)}")
+        self.accumulated_time += self.delta
+        if (self.accumulated_time > 1):
+            self.set_title(f"framerate: {int(self.fps / self.accumulated_time)}")
             self.fps = 0
-            self.last_time = self.current_time
+            self.accumulated_time = 0.0
 
     def on_draw(self) -> None:
 
@@ -0,0 +1,48 @@
+"""
+    Optional compiled kernels for SpriteGroup's hot paths.
+
+    add and remove are called in tight Python loops by bullet-hell
+    style workloads, where per-call attribute lookups and bounds
+    checks dominate. With numba installed these kernels run as
+    compiled code; otherwise identical plain-Python versions are used
+    and behavior is unchanged.
+
+    numba is deliberately not a hard dependency.
+"""
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+def _sprite_add(object_types, x, y, scale, rot, size,
+                new_type, new_x, new_y, new_scale, new_rot):
+    """
+        Store one sprite into slot size of the group's SoA arrays.
+        The caller has already ensured capacity.
+    """
+
+    object_types[size] = new_type
+    x[size] = new_x
+    y[size] = new_y
+    scale[size] = new_scale
+    rot[size] = new_rot
+
+def _sprite_remove(object_types, x, y, scale, rot, i, last):
+    """
+        Move the sprite in slot last into slot i of the group's SoA
+        arrays.
+    """
+
+    object_types[i] = object_types[last]
+    x[i] = x[last]
+    y[i] = y[last]
+    scale[i] = scale[last]
+    rot[i] = rot[last]
+
+if NUMBA_AVAILABLE:
+    sprite_add = njit(cache = True)(_sprite_add)
+    sprite_remove = njit(cache = True)(_sprite_remove)
+else:
+    sprite_add = _sprite_add
+    sprite_remove = _sprite_remove
@@ -1,5 +1,12 @@
 from .common import *
 
+#size of each slot in the streaming buffer ring
+STREAM_BUFFER_SIZE = 1 << 20
+
+#frames the CPU may run ahead of the GPU: sizes the fence ring and
+#every per-frame buffer ring
+FRAMES_IN_FLIGHT = 3
+
 class Renderer:
     """
         Around OpenGL 4.x, a lot of the developments were focussed on improving
@@ -7,10 +14,19 @@ class Renderer:
         allowed for faster drawing of arbitrary objects.
     """
     __slots__ = (
-        "_image_history", "_image_sizes", "_image_gl_id", 
+        "_image_history", "_image_sizes", "_image_gl_id",
         "_max_image_w", "_max_image_h",
-        "_shader", "_dummy_vao", "_global_info_location", 
-        "_object_info_location", "_sprite_info_location")
+        "_shader", "_dummy_vao", "_global_ubo",
+        "_sprite_groups", "_image_size_buffer", "_image_size_texture",
+        "_uv_rect_buffer", "_uv_rect_texture",
+        "_indirect_buffer", "_indirect_view", "_indirect_capacity",
+        "_commands", "_draw_queue",
+        "_quad_vbo", "_type_buffer", "_type_view",
+        "_transform_buffer", "_transform_view",
+        "_sprite_capacity", "_used_sprites",
+        "_fences", "_fence_index", "_clear_buf", "_clear_on_frame",
+        "_stream_buffers", "_stream_views",
+        "_gl_clear", "_gl_clear_color")
 
 
     def setup(self, width: int, height: int, title: str):
@@ -28,32 +44,177 @@ class Renderer:
                 The window which will be rendered to
         """
         
-        glfw.init()
-        glfw.window_hint(GLFW_CONSTANTS.GLFW_CONTEXT_VERSION_MAJOR,4)
-        glfw.window_hint(GLFW_CONSTANTS.GLFW_CONTEXT_VERSION_MINOR,5)
-        glfw.window_hint(
-            GLFW_CONSTANTS.GLFW_OPENGL_PROFILE, 
-            GLFW_CONSTANTS.GLFW_OPENGL_CORE_PROFILE)
-        glfw.window_hint(
-            GLFW_CONSTANTS.GLFW_OPENGL_FORWARD_COMPAT, 
-            GLFW_CONSTANTS.GLFW_TRUE)
-        glfw.window_hint(
-            GLFW_CONSTANTS.GLFW_DOUBLEBUFFER, 
-            GLFW_CONSTANTS.GLFW_FALSE)
-        glfw.window_hint(
-            GLFW_CONSTANTS.GLFW_RESIZABLE,
-            GLFW_CONSTANTS.GLFW_FALSE)
-        
-        window = glfw.create_window(width, height, title, None, None)
-        glfw.make_context_current(window)
+        window = make_gl_window(width, height, title, 4, 5)
 
         #image loading stuff
-        self._image_history: dict[str, int] = {}
-        self._image_sizes = np.zeros(0, dtype = np.uint32)
+        self._image_history: dict[str, tuple[int, int, int, bytes]] = {}
+        self._image_sizes: list[float] = []
         self._max_image_w = 0
         self._max_image_h = 0
 
+        self._sprite_groups = []
+
+        #canonical DrawArraysIndirectCommand per sprite group, CPU
+        #side; each frame the queued groups' commands are gathered
+        #into the mapped indirect buffer and submitted in one
+        #glMultiDrawArraysIndirect
+        self._commands = np.empty((64, 4), dtype=np.uint32)
+        self._draw_queue = []
+        self._indirect_buffer = 0
+        self._indirect_view = None
+        self._indirect_capacity = 0
+        self._grow_indirect_buffer(64)
+
+        #all sprite groups live in two shared SoA buffers, regions
+        #addressed per draw through the command's baseInstance, so the
+        #whole scene needs no vertex buffer rebinds
+        self._type_buffer = 0
+        self._type_view = None
+        self._transform_buffer = 0
+        self._transform_view = None
+        self._sprite_capacity = 0
+        self._used_sprites = 0
+        self._grow_master_buffers(1024)
+
+        #fence ring for frame pacing: the CPU runs up to two frames
+        #ahead of the GPU, then blocks instead of flushing every frame
+        self._fences = [None] * FRAMES_IN_FLIGHT
+        self._fence_index = 0
+
+        #one persistently mapped staging buffer per fence slot, for
+        #streaming uploads/readbacks without per-frame glBufferSubData
+        #sync points. The fence wait in start_drawing guarantees the
+        #slot handed out by get_stream_buffer is no longer in flight.
+        flags = GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+        self._stream_buffers = []
+        self._stream_views = []
+        for _ in self._fences:
+            buffer = glGenBuffers(1)
+            glBindBuffer(GL_ARRAY_BUFFER, buffer)
+            glBufferStorage(GL_ARRAY_BUFFER, STREAM_BUFFER_SIZE, None, flags)
+            self._stream_buffers.append(buffer)
+            self._stream_views.append(map_buffer_as_array(
+                GL_ARRAY_BUFFER, STREAM_BUFFER_SIZE, flags, np.uint8))
+
+        #last issued clear color, in reusable ctypes storage (the -1
+        #sentinel can never match, so the first set always goes out)
+        self._clear_buf = (ctypes.c_float * 4)(-1.0, -1.0, -1.0, -1.0)
+        self._clear_on_frame = True
+
+        #glClear runs every frame, glClearColor every color change:
+        #call them through raw ctypes pointers where available,
+        #skipping PyOpenGL's dispatch
+        self._gl_clear = load_gl_function(
+            "glClear", None, ctypes.c_uint) or glClear
+        self._gl_clear_color = load_gl_function(
+            "glClearColor", None,
+            ctypes.c_float, ctypes.c_float,
+            ctypes.c_float, ctypes.c_float) or glClearColor
+
+        #one VAO for every sprite group: the attribute formats are
+        #described once and draws just rebind the vertex buffers
+        self._dummy_vao = glGenVertexArrays(1)
+        glBindVertexArray(self._dummy_vao)
+
+        glVertexAttribIFormat(0, 1, GL_UNSIGNED_INT, 0)
+        glVertexAttribBinding(0, 0)
+        glVertexBindingDivisor(0, 1)
+        glEnableVertexAttribArray(0)
+
+        glVertexAttribFormat(1, 4, GL_FLOAT, GL_FALSE, 0)
+        glVertexAttribBinding(1, 1)
+        glVertexBindingDivisor(1, 1)
+        glEnableVertexAttribArray(1)
+
+        #per-vertex corners of the shared unit quad, bound once: this
+        #binding point never changes
+        self._quad_vbo = create_quad_vbo()
+        glVertexAttribFormat(2, 2, GL_FLOAT, GL_FALSE, 0)
+        glVertexAttribBinding(2, 2)
+        glEnableVertexAttribArray(2)
+        glVertexAttribFormat(3, 2, GL_FLOAT, GL_FALSE, 8)
+        glVertexAttribBinding(3, 2)
+        glEnableVertexAttribArray(3)
+        glBindVertexBuffer(2, self._quad_vbo, 0, 16)
+
         return window
+
+    def _grow_indirect_buffer(self, capacity: int) -> None:
+        """
+            (Re)allocate the indirect draw command buffer with room for
+            the given number of commands per in-flight frame. The
+            buffer is per-frame scratch (the canonical commands live in
+            _commands), so nothing is carried over. It is ringed like
+            the stream buffers: the GPU sources indirect parameters at
+            execution time, so each frame must write a slot no queued
+            frame still reads.
+        """
+
+        flags = GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+
+        if self._indirect_buffer:
+            glDeleteBuffers(1, (self._indirect_buffer,))
+
+        nbytes = FRAMES_IN_FLIGHT * 16 * capacity
+        self._indirect_buffer = glGenBuffers(1)
+        glBindBuffer(GL_DRAW_INDIRECT_BUFFER, self._indirect_buffer)
+        glBufferStorage(GL_DRAW_INDIRECT_BUFFER, nbytes, None, flags)
+        self._indirect_view = map_buffer_as_array(
+            GL_DRAW_INDIRECT_BUFFER, nbytes,
+            flags, np.uint32).reshape(FRAMES_IN_FLIGHT, capacity, 4)
+        self._indirect_capacity = capacity
+
+    def _grow_master_buffers(self, capacity: int) -> None:
+        """
+            (Re)allocate the shared object type and transform buffers
+            with room for the given number of sprites, carrying over
+            every registered group's data.
+        """
+
+        flags = GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+        used = self._used_sprites
+
+        #carry-over runs GPU side with glCopyBufferSubData: the
+        #mappings are write-only (reading write-combined memory back
+        #through them would be both undefined and slow)
+        old_type_buffer = self._type_buffer
+        self._type_buffer = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self._type_buffer)
+        glBufferStorage(GL_ARRAY_BUFFER, 4 * capacity, None, flags)
+        self._type_view = map_buffer_as_array(
+            GL_ARRAY_BUFFER, 4 * capacity, flags, np.uint32)
+        if old_type_buffer and used:
+            glBindBuffer(GL_COPY_READ_BUFFER, old_type_buffer)
+            glBindBuffer(GL_COPY_WRITE_BUFFER, self._type_buffer)
+            glCopyBufferSubData(
+                GL_COPY_READ_BUFFER, GL_COPY_WRITE_BUFFER, 0, 0, 4 * used)
+
+        old_transform_buffer = self._transform_buffer
+        self._transform_buffer = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self._transform_buffer)
+        glBufferStorage(GL_ARRAY_BUFFER, 16 * capacity, None, flags)
+        self._transform_view = map_buffer_as_array(
+            GL_ARRAY_BUFFER, 16 * capacity,
+            flags, np.float32).reshape(capacity, 4)
+        if old_transform_buffer and used:
+            glBindBuffer(GL_COPY_READ_BUFFER, old_transform_buffer)
+            glBindBuffer(GL_COPY_WRITE_BUFFER, self._transform_buffer)
+            glCopyBufferSubData(
+                GL_COPY_READ_BUFFER, GL_COPY_WRITE_BUFFER, 0, 0, 16 * used)
+
+        if old_type_buffer:
+            #the copies are GPU commands writing the freshly mapped
+            #stores: wait for them before the CPU writes through the
+            #new mappings. Growth is rare and amortized, so the stall
+            #is acceptable.
+            fence = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+            glClientWaitSync(
+                fence, GL_SYNC_FLUSH_COMMANDS_BIT, 1_000_000_000)
+            glDeleteSync(fence)
+            glDeleteBuffers(1, (old_type_buffer,))
+            glDeleteBuffers(1, (old_transform_buffer,))
+
+        self._sprite_capacity = capacity
     
     def set_clear_color(self, color: tuple[float]) -> None:
         """
@@ -65,7 +226,46 @@ class Renderer:
                     channel is a float in the range [0, 1.0]
         """
 
-        glClearColor(*color)
+        #channels are copied into reusable ctypes storage (callers may
+        #hand in a reused array, and holding a reference would never
+        #see a change), and the driver call is skipped when nothing
+        #changed: callers commonly set the same color every frame
+        r = color[0]
+        g = color[1]
+        b = color[2]
+        a = color[3]
+        buf = self._clear_buf
+        if r == buf[0] and g == buf[1] and b == buf[2] and a == buf[3]:
+            return
+        buf[0] = r
+        buf[1] = g
+        buf[2] = b
+        buf[3] = a
+        self._gl_clear_color(r, g, b, a)
+
+    def get_stream_buffer(self) -> tuple[int, np.ndarray]:
+        """
+            The current frame's streaming staging buffer.
+
+            Returns:
+
+                (buffer, view): the GL buffer name and a writable
+                uint8 numpy view of its persistently mapped storage.
+                The slot rotates with the fence ring, so by the time
+                it comes around again the GPU is done with it.
+        """
+
+        i = self._fence_index
+        return self._stream_buffers[i], self._stream_views[i]
+
+    def set_clear_on_frame(self, clear_on_frame: bool) -> None:
+        """
+            Choose whether the screen is cleared at the start of each
+            frame. Applications that overdraw every pixel can skip the
+            clear and save the bandwidth.
+        """
+
+        self._clear_on_frame = clear_on_frame
 
     def load_image(self, filename: str) -> int:
         """
@@ -82,14 +282,17 @@ class Renderer:
         """
 
         if filename in self._image_history:
-            return self._image_history[filename]
+            return self._image_history[filename][0]
 
         i = len(self._image_history)
-        self._image_history[filename] = i
 
         with Image.open(filename, mode = "r") as img:
             w, h = img.size
-            self._image_sizes = np.append(self._image_sizes, (w,h))
+            #decode once, upload later: after_setup streams these bytes
+            #straight to the GPU without reopening the file
+            data = img.convert("RGBA").tobytes()
+            self._image_history[filename] = (i, w, h, data)
+            self._image_sizes.extend((w, h))
             self._max_image_w = max(w, self._max_image_w)
             self._max_image_h = max(h, self._max_image_h)
 
@@ -102,37 +305,308 @@ class Renderer:
 
         if len(self._image_history) > 0:
 
+            #shelf-pack every image into one 2D atlas: a max-sized
+            #texture array wastes VRAM on every image smaller than the
+            #largest one
+            dims = [(w, h) for _, w, h, _ in self._image_history.values()]
+            atlas_w, atlas_h, offsets = pack_atlas(dims)
+
             self._image_gl_id = glGenTextures(1)
-            glBindTexture(GL_TEXTURE_2D_ARRAY, self._image_gl_id)
-            glTexStorage3D(GL_TEXTURE_2D_ARRAY, 1, GL_RGBA8, 
-                        self._max_image_w, self._max_image_h, len(self._image_history))
-            
-            for filename, i in self._image_history.items():
-                with Image.open(filename, mode = "r") as img:
-                    w, h = img.size
-                    data = bytes(img.convert("RGBA").tobytes())
-                    glTexSubImage3D(GL_TEXTURE_2D_ARRAY, 0, 
-                                    0, 0, i, 
-                                    w, h, 0,
-                                    GL_RGBA,GL_UNSIGNED_BYTE,data)
-            
-            glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_WRAP_R, GL_REPEAT)
-            glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_WRAP_S, GL_REPEAT)
-            glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_WRAP_T, GL_REPEAT)
-            glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
-            glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-    
+            glBindTexture(GL_TEXTURE_2D, self._image_gl_id)
+            glTexStorage2D(GL_TEXTURE_2D, 1, GL_RGBA8, atlas_w, atlas_h)
+
+            #stage every image through one pixel unpack buffer, rather
+            #than handing the driver a fresh client pointer per image
+            upload_atlas_images(self._image_history.values(), offsets)
+
+            #the bytes are staged on the GPU now: drop the CPU copies
+            #rather than holding every decoded texture for the process
+            #lifetime
+            for filename, (i, w, h, _) in self._image_history.items():
+                self._image_history[filename] = (i, w, h, None)
+
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+
+            #per-image half sizes, fetched in the vertex shader by object
+            #type. Keeping them GPU-side means sprite groups upload their
+            #raw SoA arrays with no CPU interleave step.
+            sizes = np.asarray(self._image_sizes, dtype=np.float32) * 0.5
+            self._image_size_buffer = glGenBuffers(1)
+            glBindBuffer(GL_TEXTURE_BUFFER, self._image_size_buffer)
+            glBufferData(GL_TEXTURE_BUFFER, sizes.nbytes, sizes, GL_STATIC_DRAW)
+            self._image_size_texture = glGenTextures(1)
+            glActiveTexture(GL_TEXTURE1)
+            glBindTexture(GL_TEXTURE_BUFFER, self._image_size_texture)
+            glTexBuffer(GL_TEXTURE_BUFFER, GL_RG32F, self._image_size_buffer)
+
+            #normalized uv rect per image, fetched by object type in
+            #the vertex shader
+            rects = np.empty((len(dims), 4), dtype=np.float32)
+            rects[:, 0:2] = np.asarray(offsets, dtype=np.float32)
+            rects[:, 2:4] = np.asarray(dims, dtype=np.float32)
+            rects /= (atlas_w, atlas_h, atlas_w, atlas_h)
+            self._uv_rect_buffer = glGenBuffers(1)
+            glBindBuffer(GL_TEXTURE_BUFFER, self._uv_rect_buffer)
+            glBufferData(GL_TEXTURE_BUFFER, rects.nbytes, rects, GL_STATIC_DRAW)
+            self._uv_rect_texture = glGenTextures(1)
+            glActiveTexture(GL_TEXTURE2)
+            glBindTexture(GL_TEXTURE_BUFFER, self._uv_rect_texture)
+            glTexBuffer(GL_TEXTURE_BUFFER, GL_RGBA32F, self._uv_rect_buffer)
+            glActiveTexture(GL_TEXTURE0)
+
+        vertex_src = """
+#version 450
+layout(std140, binding=0) uniform Globals {
+    vec4 screenSize_maxSize;
+};
+uniform samplerBuffer imageSizes;
+uniform samplerBuffer uvRects;
+layout(location=0) in uint objectType;
+layout(location=1) in vec4 transform;
+layout(location=2) in vec2 quadPos;
+layout(location=3) in vec2 quadUV;
+
+out vec2 fragTexCoord;
+
+void main() {
+    vec2 imageSize = texelFetch(imageSizes, int(objectType)).xy;
+    vec2 pos = quadPos;
+
+    //scale
+    pos = imageSize * transform.z * pos;
+
+    //rotate
+    float c = cos(radians(transform.w));
+    float s = sin(radians(transform.w));
+    pos = vec2(pos.x * c - pos.y * s, pos.x * s + pos.y * c);
+
+    //translate
+    pos = pos + transform.xy;
+
+    //convert to NDC
+    pos = (pos - screenSize_maxSize.xy) / screenSize_maxSize.xy;
+
+    gl_Position = vec4(pos, 0.0, 1.0);
+
+    vec4 rect = texelFetch(uvRects, int(objectType));
+    fragTexCoord = rect.xy + quadUV * rect.zw;
+}
+"""
+
+        fragment_src = """
+#version 450
+uniform sampler2D material;
+
+in vec2 fragTexCoord;
+
+out vec4 color;
+
+void main() {
+    vec4 sampled = texture(material, fragTexCoord);
+
+    if (sampled.a < 0.1) {
+        discard;
+    }
+
+    color = sampled;
+}
+"""
+        info = (
+            (GL_VERTEX_SHADER, vertex_src),
+            (GL_FRAGMENT_SHADER, fragment_src)
+        )
+        self._shader = create_shader_program_cached(info)
+        glUseProgram(self._shader)
+        glUniform1i(glGetUniformLocation(self._shader, "material"), 0)
+        glUniform1i(glGetUniformLocation(self._shader, "imageSizes"), 1)
+        glUniform1i(glGetUniformLocation(self._shader, "uvRects"), 2)
+
+        #globals live in a UBO, rewritten only when the framebuffer
+        #actually changes size — never per frame
+        self._global_ubo = glGenBuffers(1)
+        glBindBuffer(GL_UNIFORM_BUFFER, self._global_ubo)
+        glBufferData(GL_UNIFORM_BUFFER, 16, None, GL_STATIC_DRAW)
+        glBindBufferBase(GL_UNIFORM_BUFFER, 0, self._global_ubo)
+
+        w, h = glfw.get_framebuffer_size(window)
+        self._update_globals(window, w, h)
+        glfw.set_framebuffer_size_callback(window, self._update_globals)
+
+    def _update_globals(self, window, width: int, height: int) -> None:
+        """
+            Recompute the global shader constants for a framebuffer
+            size. Registered as the framebuffer resize callback.
+        """
+
+        global_info = np.array(
+            (width / 2, height / 2,
+             self._max_image_w / 2, self._max_image_h / 2),
+            dtype=np.float32)
+        glBindBuffer(GL_UNIFORM_BUFFER, self._global_ubo)
+        glBufferSubData(
+            GL_UNIFORM_BUFFER, 0, global_info.nbytes, global_info)
+
+    def register_sprite_group(self, object_types: np.ndarray,
+                              x: np.ndarray, y: np.ndarray,
+                              scale: np.ndarray, rotation: np.ndarray,
+                              size: int) -> int:
+        """
+            Upload a sprite group's SoA arrays to the GPU.
+            The vertex shader gathers per-image sizes itself, so no
+            CPU-side size lookup is needed.
+
+            Buffers are persistently mapped: later updates are plain
+            numpy stores into GPU-visible memory, no re-upload.
+        """
+
+        offset = self._used_sprites
+        if offset + size > self._sprite_capacity:
+            new_capacity = self._sprite_capacity * 2
+            while new_capacity < offset + size:
+                new_capacity *= 2
+            self._grow_master_buffers(new_capacity)
+        self._used_sprites = offset + size
+
+        self._write_group(offset, object_types, x, y, scale, rotation, size)
+
+        id = len(self._sprite_groups)
+        if id >= len(self._commands):
+            new_commands = np.empty(
+                (2 * len(self._commands), 4), dtype=np.uint32)
+            new_commands[:id] = self._commands[:id]
+            self._commands = new_commands
+        #count, instanceCount, first, baseInstance
+        self._commands[id] = (4, size, 0, offset)
+        self._sprite_groups.append((offset, size, size))
+        return id
+
+    def _write_group(self, offset: int, object_types: np.ndarray,
+                     x: np.ndarray, y: np.ndarray,
+                     scale: np.ndarray, rotation: np.ndarray,
+                     size: int) -> None:
+        """
+            Store a group's sprite data into its region of the shared
+            buffers, which are persistently mapped: these are plain
+            numpy stores into GPU-visible memory.
+        """
+
+        end = offset + size
+        self._type_view[offset:end] = object_types[:size]
+        transforms = self._transform_view
+        transforms[offset:end, 0] = x[:size]
+        transforms[offset:end, 1] = y[:size]
+        transforms[offset:end, 2] = scale[:size]
+        transforms[offset:end, 3] = rotation[:size]
+
+    def update_sprite_group(self, id: int, object_types: np.ndarray,
+                            x: np.ndarray, y: np.ndarray,
+                            scale: np.ndarray, rotation: np.ndarray,
+                            size: int) -> None:
+        """
+            Rewrite a registered sprite group's data in place. A group
+            that outgrew its region is moved to a fresh region at the
+            tail of the master buffers instead.
+        """
+
+        offset, _, capacity = self._sprite_groups[id]
+        if size > capacity:
+            #regions are append-only, so the old region is abandoned
+            #and the group's command repointed through its baseInstance
+            offset = self._used_sprites
+            if offset + size > self._sprite_capacity:
+                new_capacity = self._sprite_capacity * 2
+                while new_capacity < offset + size:
+                    new_capacity *= 2
+                self._grow_master_buffers(new_capacity)
+            self._used_sprites = offset + size
+            capacity = size
+            self._commands[id, 3] = offset
+        else:
+            #the region being rewritten may still be read by frames in
+            #flight: drain them first. A fresh region needs no wait.
+            self._wait_all_fences()
+        self._write_group(offset, object_types, x, y, scale, rotation, size)
+        self._commands[id, 1] = size
+        self._sprite_groups[id] = (offset, size, capacity)
+
+    def _wait_all_fences(self) -> None:
+        """
+            Block until every in-flight frame has finished. Needed
+            before rewriting mapped buffer regions that queued frames
+            may still read; rare paths only, the per-frame wait in
+            start_drawing covers the ring-buffered scratch.
+        """
+
+        for i, fence in enumerate(self._fences):
+            if fence is not None:
+                glClientWaitSync(
+                    fence, GL_SYNC_FLUSH_COMMANDS_BIT, 1_000_000_000)
+                glDeleteSync(fence)
+                self._fences[i] = None
+
+    def draw_sprite_group(self, id: int) -> None:
+        """
+            Queue a set of sprites for drawing. The queue is submitted
+            as a single indirect multi-draw in finish_drawing.
+
+            Parameters:
+
+                id: handle of the sprite group to draw.
+        """
+
+        self._draw_queue.append(id)
+
     def start_drawing(self) -> None:
         """
             Perform any necessary setup before receiving draw commands
         """
 
-        glClear(GL_COLOR_BUFFER_BIT)
+        #wait for the frame that used this fence slot before reusing
+        #its share of the mapped buffers
+        fence = self._fences[self._fence_index]
+        if fence is not None:
+            glClientWaitSync(
+                fence, GL_SYNC_FLUSH_COMMANDS_BIT, 1_000_000_000)
+            glDeleteSync(fence)
+            self._fences[self._fence_index] = None
+
+        if self._clear_on_frame:
+            self._gl_clear(GL_COLOR_BUFFER_BIT)
+        self._draw_queue.clear()
 
     def finish_drawing(self, window) -> None:
         """
-            Called once per frame to draw stuff.
-            Override this function to make your game draw things.
+            Submit every queued sprite group in one
+            glMultiDrawArraysIndirect, then flush.
         """
 
-        glFlush()
\ No newline at end of file
+        count = len(self._draw_queue)
+        if count:
+            if count > self._indirect_capacity:
+                self._grow_indirect_buffer(2 * count)
+            #gather the queued groups' commands into this frame's slot
+            #of the mapped indirect buffer: one driver call draws the
+            #whole frame, and slots from frames still in flight are
+            #left untouched
+            slot = self._fence_index
+            self._indirect_view[slot, :count] = self._commands[self._draw_queue]
+            glBindVertexBuffer(0, self._type_buffer, 0, 4)
+            glBindVertexBuffer(1, self._transform_buffer, 0, 16)
+            glMultiDrawArraysIndirect(
+                GL_TRIANGLE_STRIP,
+                ctypes.c_void_p(slot * 16 * self._indirect_capacity),
+                count, 0)
+            self._draw_queue.clear()
+
+        #the swap is the frame's one submission point: the driver can
+        #overlap the next frame's work with this one's scanout
+        glfw.swap_buffers(window)
+
+        #a fence instead of a flush: CPU and GPU frames overlap
+        #instead of serializing
+        self._fences[self._fence_index] = glFenceSync(
+            GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        self._fence_index = (self._fence_index + 1) % len(self._fences)
\ No newline at end of file
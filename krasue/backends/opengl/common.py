@@ -1,3 +1,17 @@
+import atexit
+import ctypes
+import hashlib
+import os
+
+#PyOpenGL wraps every GL call with argument checks and a glGetError
+#round trip — pure Python overhead multiplied by every call in the
+#frame loop. Turn it off unless the developer asks for it; this has
+#to happen before OpenGL.GL is imported anywhere.
+import OpenGL
+if not os.environ.get("KRASUE_DEBUG"):
+    OpenGL.ERROR_CHECKING = False
+    OpenGL.ERROR_LOGGING = False
+
 import glfw
 import glfw.GLFW as GLFW_CONSTANTS
 from PIL import Image
@@ -5,13 +19,68 @@ import numpy as np
 from OpenGL.GL import *
 from OpenGL.GL.shaders import compileProgram, compileShader
 
-def create_shader_program(module_info: tuple[tuple[int, str]]) -> int:
+_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "krasue")
+
+_GLFW_INITIALIZED = False
+
+#window hints shared by every GL backend, constants resolved once at
+#import instead of per setup
+_WINDOW_HINTS = (
+    (GLFW_CONSTANTS.GLFW_OPENGL_PROFILE,
+     GLFW_CONSTANTS.GLFW_OPENGL_CORE_PROFILE),
+    (GLFW_CONSTANTS.GLFW_OPENGL_FORWARD_COMPAT,
+     GLFW_CONSTANTS.GLFW_TRUE),
+    (GLFW_CONSTANTS.GLFW_DOUBLEBUFFER,
+     GLFW_CONSTANTS.GLFW_TRUE),
+    (GLFW_CONSTANTS.GLFW_RESIZABLE,
+     GLFW_CONSTANTS.GLFW_FALSE))
+
+def make_gl_window(width: int, height: int, title: str,
+                   major: int, minor: int):
+    """
+        Create a window with a current OpenGL context.
+
+        Parameters:
+
+            width, height: size of the window
+
+            title: title for the window caption
+
+            major, minor: OpenGL context version to request
+
+        Returns:
+
+            The newly created glfw window
+    """
+
+    #initializing glfw walks the platform's monitor and input
+    #backends, so do it once per process, not once per window
+    global _GLFW_INITIALIZED
+    if not _GLFW_INITIALIZED:
+        glfw.init()
+        atexit.register(glfw.terminate)
+        _GLFW_INITIALIZED = True
+
+    glfw.window_hint(GLFW_CONSTANTS.GLFW_CONTEXT_VERSION_MAJOR, major)
+    glfw.window_hint(GLFW_CONSTANTS.GLFW_CONTEXT_VERSION_MINOR, minor)
+    for hint, value in _WINDOW_HINTS:
+        glfw.window_hint(hint, value)
+
+    window = glfw.create_window(width, height, title, None, None)
+    glfw.make_context_current(window)
+    return window
+
+def create_shader_program(module_info: tuple[tuple[int, str]],
+                          retrievable: bool = False) -> int:
     """
         Create an OpenGL shader program.
 
         Parameters:
 
             module_info: holds the source code and module types
+
+            retrievable: whether the linked binary should be
+                retrievable with glGetProgramBinary
     """
 
     modules = []
@@ -19,13 +88,241 @@ def create_shader_program(module_info: tuple[tuple[int, str]]) -> int:
     for description in module_info:
         modules.append(create_shader_module(description))
 
-    shader = compileProgram(*modules)
+    shader = glCreateProgram()
+    for module in modules:
+        glAttachShader(shader, module)
+    if retrievable:
+        glProgramParameteri(
+            shader, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
+    glLinkProgram(shader)
+    if not glGetProgramiv(shader, GL_LINK_STATUS):
+        raise RuntimeError(glGetProgramInfoLog(shader))
 
     for module in modules:
         glDeleteShader(module)
 
     return shader
 
+def create_shader_program_cached(module_info: tuple[tuple[int, str]]) -> int:
+    """
+        Create an OpenGL shader program, caching the linked binary on
+        disk so repeated launches skip the compile entirely.
+
+        Parameters:
+
+            module_info: holds the source code and module types
+    """
+
+    key = hashlib.blake2b()
+    for module_type, src in module_info:
+        key.update(src.encode())
+    key.update(glGetString(GL_RENDERER) or b"")
+    key.update(glGetString(GL_VERSION) or b"")
+    filename = os.path.join(_CACHE_DIR, key.hexdigest() + ".bin")
+
+    #fast path: load a previously linked binary
+    try:
+        with open(filename, "rb") as file:
+            blob = file.read()
+        binary_format = int.from_bytes(blob[:4], "little")
+        binary = blob[4:]
+        shader = glCreateProgram()
+        glProgramBinary(shader, binary_format, binary, len(binary))
+        if glGetProgramiv(shader, GL_LINK_STATUS):
+            return shader
+        #stale binary (eg. driver update), fall through and recompile
+        glDeleteProgram(shader)
+    except Exception:
+        #unreadable cache entry, or glProgramBinary itself raising on
+        #a stale blob (it reports GL errors under KRASUE_DEBUG):
+        #anything wrong with the cache just means recompiling
+        pass
+
+    shader = create_shader_program(module_info, retrievable = True)
+
+    length = glGetProgramiv(shader, GL_PROGRAM_BINARY_LENGTH)
+    if length > 0:
+        size = GLsizei()
+        binary_format = GLenum()
+        binary = (GLubyte * length)()
+        glGetProgramBinary(shader, length, size, binary_format, binary)
+        try:
+            os.makedirs(_CACHE_DIR, exist_ok = True)
+            with open(filename, "wb") as file:
+                file.write(binary_format.value.to_bytes(4, "little"))
+                file.write(bytes(binary[:size.value]))
+        except OSError:
+            pass
+
+    return shader
+
+def pack_atlas(
+    sizes: list[tuple[int, int]]) -> tuple[int, int, list[tuple[int, int]]]:
+    """
+        Shelf-pack image sizes into one 2D atlas, with a 1 pixel
+        gutter between placements so linear filtering at sprite edges
+        never blends in a neighboring image.
+
+        Parameters:
+
+            sizes: (width, height) of each image
+
+        Returns:
+
+            (atlas_width, atlas_height, offsets) where offsets[i] is
+            the top-left corner assigned to image i.
+    """
+
+    total_area = 0
+    max_w = 1
+    for w, h in sizes:
+        total_area += (w + 1) * (h + 1)
+        max_w = max(max_w, w)
+
+    #roughly square atlas, width a power of two and at least as wide
+    #as the widest image
+    atlas_w = 1
+    while atlas_w * atlas_w < total_area or atlas_w < max_w:
+        atlas_w *= 2
+
+    #tallest first, so each shelf wastes as little height as possible
+    order = sorted(
+        range(len(sizes)), key = lambda i: sizes[i][1], reverse = True)
+    offsets: list[tuple[int, int]] = [(0, 0)] * len(sizes)
+    x = 0
+    y = 0
+    shelf_h = 0
+    for i in order:
+        w, h = sizes[i]
+        if x + w > atlas_w:
+            y += shelf_h
+            x = 0
+            shelf_h = 0
+        offsets[i] = (x, y)
+        #the gutter keeps the bilinear footprint at uv 0/1 inside this
+        #image; the uv rects stay at the unpadded size
+        x += w + 1
+        shelf_h = max(shelf_h, h + 1)
+
+    return atlas_w, y + shelf_h, offsets
+
+def load_gl_function(name: str, restype, *argtypes):
+    """
+        Resolve a GL entry point through glfw and wrap it as a direct
+        ctypes function, bypassing PyOpenGL's per-call dispatch for
+        functions sitting in the frame loop. Requires a current
+        context.
+
+        Parameters:
+
+            name: the GL function name, e.g. "glClear"
+
+            restype, argtypes: the ctypes signature
+
+        Returns:
+
+            The callable, or None if the driver doesn't expose the
+            symbol (callers fall back to the PyOpenGL wrapper).
+    """
+
+    address = glfw.get_proc_address(name)
+    if not address:
+        return None
+    return ctypes.CFUNCTYPE(restype, *argtypes)(address)
+
+def create_quad_vbo() -> int:
+    """
+        Upload the unit sprite quad as a static VBO: four corners in
+        triangle strip order, 16 bytes each (pos.xy, uv.xy). Consuming
+        these as plain vertex attributes beats indexing a const array
+        with gl_VertexID in the vertex shader.
+
+        Returns:
+
+            The quad vertex buffer
+    """
+
+    vertices = np.array((
+        (-1.0, -1.0, 0.0, 1.0),
+        ( 1.0, -1.0, 1.0, 1.0),
+        (-1.0,  1.0, 0.0, 0.0),
+        ( 1.0,  1.0, 1.0, 0.0)), dtype=np.float32)
+    vbo = glGenBuffers(1)
+    glBindBuffer(GL_ARRAY_BUFFER, vbo)
+    glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+    return vbo
+
+def upload_atlas_images(
+    images, offsets: list[tuple[int, int]]) -> None:
+    """
+        Upload decoded RGBA images into the 2D atlas texture currently
+        bound to GL_TEXTURE_2D, staged through a single pixel unpack
+        buffer so the driver can DMA the transfers asynchronously
+        instead of synchronizing on every image.
+
+        Parameters:
+
+            images: iterable of (index, width, height, rgba_bytes)
+
+            offsets: top-left atlas corner per image index
+    """
+
+    entries = list(images)
+
+    #tightly packed rows, so the driver can DMA the bytes directly
+    #instead of realigning them with an internal copy
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+    glPixelStorei(GL_UNPACK_ROW_LENGTH, 0)
+
+    total = sum(len(data) for _, _, _, data in entries)
+    pbo = glGenBuffers(1)
+    glBindBuffer(GL_PIXEL_UNPACK_BUFFER, pbo)
+    glBufferData(GL_PIXEL_UNPACK_BUFFER, total, None, GL_STREAM_DRAW)
+    ptr = glMapBufferRange(
+        GL_PIXEL_UNPACK_BUFFER, 0, total,
+        GL_MAP_WRITE_BIT | GL_MAP_INVALIDATE_BUFFER_BIT)
+    address = ctypes.cast(ptr, ctypes.c_void_p).value
+
+    staging_offset = 0
+    staging_offsets = []
+    for _, _, _, data in entries:
+        ctypes.memmove(address + staging_offset, data, len(data))
+        staging_offsets.append(staging_offset)
+        staging_offset += len(data)
+    glUnmapBuffer(GL_PIXEL_UNPACK_BUFFER)
+
+    for (i, w, h, _), staging_offset in zip(entries, staging_offsets):
+        x, y = offsets[i]
+        glTexSubImage2D(GL_TEXTURE_2D, 0,
+                        x, y, w, h,
+                        GL_RGBA, GL_UNSIGNED_BYTE,
+                        ctypes.c_void_p(staging_offset))
+
+    glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+    glDeleteBuffers(1, (pbo,))
+
+def map_buffer_as_array(target: int, nbytes: int,
+                        access: int, dtype) -> np.ndarray:
+    """
+        Map the buffer currently bound to target and wrap the mapped
+        pointer as a writable numpy array.
+
+        Parameters:
+
+            target: buffer binding point, e.g. GL_ARRAY_BUFFER
+
+            nbytes: number of bytes to map
+
+            access: access flags for glMapBufferRange
+
+            dtype: numpy dtype for the returned view
+    """
+
+    ptr = glMapBufferRange(target, 0, nbytes, access)
+    address = ctypes.cast(ptr, ctypes.c_void_p).value
+    buffer = (ctypes.c_byte * nbytes).from_address(address)
+    return np.frombuffer(buffer, dtype = dtype)
+
 def create_shader_module(module_info: tuple[int, str]) -> int:
     """
         Create an OpenGL shader module
@@ -1,14 +1,27 @@
 from .common import *
 
+#per-instance vertex layout: half floats are plenty of precision at
+#screen resolution and halve the fetch bandwidth compared to fp32.
+#Everything (the image index included, exact as a half up to 2048
+#images) is half floats, so the 16 bytes feed exactly two vec4
+#attributes
+INSTANCE_DTYPE = np.dtype({
+    "names": ("size", "type", "scale", "center", "rotation"),
+    "formats": (("<f2", 2), "<f2", "<f2", ("<f2", 2), ("<f2", 2)),
+    "offsets": (0, 4, 6, 8, 12),
+    "itemsize": 16})
+
 class Renderer:
     """
         OpenGL 3.3 renderer. Can do instanced rendering but not indirect.
     """
 
-    #__slots__ = (
-    #    "_max_image_w ", "_max_image_h", "_image_history", "_image_sizes", 
-    #    "_sprite_groups", "_image_gl_id", "_dummy_vao", "_shader",
-    #    "_global_info_location")
+    __slots__ = (
+        "_max_image_w", "_max_image_h", "_image_history", "_image_sizes",
+        "_image_size_array", "_sprite_groups", "_image_gl_id",
+        "_uv_rect_buffer", "_uv_rect_texture", "_quad_vbo",
+        "_dummy_vao", "_shader", "_global_ubo", "_clear_on_frame",
+        "_gl_clear")
 
     def setup(self, width: int, height: int, title: str):
         """
@@ -25,37 +38,29 @@ class Renderer:
                 The window which will be rendered to
         """
         
-        glfw.init()
-        glfw.window_hint(GLFW_CONSTANTS.GLFW_CONTEXT_VERSION_MAJOR,3)
-        glfw.window_hint(GLFW_CONSTANTS.GLFW_CONTEXT_VERSION_MINOR,3)
-        glfw.window_hint(
-            GLFW_CONSTANTS.GLFW_OPENGL_PROFILE, 
-            GLFW_CONSTANTS.GLFW_OPENGL_CORE_PROFILE)
-        glfw.window_hint(
-            GLFW_CONSTANTS.GLFW_OPENGL_FORWARD_COMPAT, 
-            GLFW_CONSTANTS.GLFW_TRUE)
-        glfw.window_hint(
-            GLFW_CONSTANTS.GLFW_DOUBLEBUFFER, 
-            GLFW_CONSTANTS.GLFW_FALSE)
-        glfw.window_hint(
-            GLFW_CONSTANTS.GLFW_RESIZABLE,
-            GLFW_CONSTANTS.GLFW_FALSE)
-        
-        window = glfw.create_window(width, height, title, None, None)
-        glfw.make_context_current(window)
+        window = make_gl_window(width, height, title, 3, 3)
 
         self._max_image_w = 0
         self._max_image_h = 0
-        self._image_history: dict[str, int] = {}
-        self._image_sizes = np.zeros(0, dtype = np.uint32)
+        self._image_history: dict[str, tuple[int, int, int, bytes]] = {}
+        self._image_sizes: list[float] = []
+        self._image_size_array = None
         self._sprite_groups = []
 
         self._image_gl_id = 0
+        self._uv_rect_buffer = 0
+        self._uv_rect_texture = 0
+        self._quad_vbo = create_quad_vbo()
         self._dummy_vao = 0
         self._shader = 0
-        self._global_info_location = 0
-        self._object_info_location = 0
-        self._sprite_info_location = 0
+        self._global_ubo = 0
+
+        self._clear_on_frame = True
+
+        #glClear runs every frame: call it through a raw ctypes
+        #pointer where available, skipping PyOpenGL's dispatch
+        self._gl_clear = load_gl_function(
+            "glClear", None, ctypes.c_uint) or glClear
 
         glEnable(GL_STENCIL_TEST)
         glStencilMask(0xFF)
@@ -76,6 +81,15 @@ class Renderer:
 
         glClearColor(*color)
 
+    def set_clear_on_frame(self, clear_on_frame: bool) -> None:
+        """
+            Choose whether the screen is cleared at the start of each
+            frame. Applications that overdraw every pixel can skip the
+            clear and save the bandwidth.
+        """
+
+        self._clear_on_frame = clear_on_frame
+
     def load_image(self, filename: str) -> int:
         """
             Registers an image for loading.
@@ -91,19 +105,35 @@ class Renderer:
         """
 
         if filename in self._image_history:
-            return self._image_history[filename]
+            return self._image_history[filename][0]
 
         i = len(self._image_history)
-        self._image_history[filename] = i
 
         with Image.open(filename, mode = "r") as img:
             w, h = img.size
-            self._image_sizes = np.append(self._image_sizes, (w / 2, h / 2))
+            #decode once, upload later: after_setup streams these bytes
+            #straight to the GPU without reopening the file
+            data = img.convert("RGBA").tobytes()
+            self._image_history[filename] = (i, w, h, data)
+            self._image_sizes.extend((w / 2, h / 2))
             self._max_image_w = max(w, self._max_image_w)
             self._max_image_h = max(h, self._max_image_h)
 
         return i
-    
+
+    def _image_sizes_f32(self) -> np.ndarray:
+        """
+            The loaded images' half sizes as a float32 (N, 2) array.
+            Cached, so repeated sprite group registrations don't pay
+            the list conversion again.
+        """
+
+        if (self._image_size_array is None
+            or 2 * len(self._image_size_array) != len(self._image_sizes)):
+            self._image_size_array = np.asarray(
+                self._image_sizes, dtype=np.float32).reshape(-1, 2)
+        return self._image_size_array
+
     def after_setup(self, window) -> None:
         """
             Upload all image handles to the GPU
@@ -115,61 +145,76 @@ class Renderer:
 
         if (len(self._image_history) > 0):
 
+            #shelf-pack every image into one 2D atlas: a max-sized
+            #texture array wastes VRAM on every image smaller than the
+            #largest one
+            dims = [(w, h) for _, w, h, _ in self._image_history.values()]
+            atlas_w, atlas_h, offsets = pack_atlas(dims)
+
             self._image_gl_id = glGenTextures(1)
-            glBindTexture(GL_TEXTURE_2D_ARRAY, self._image_gl_id)
-            glTexStorage3D(GL_TEXTURE_2D_ARRAY, 1, GL_RGBA8, 
-                        self._max_image_w, self._max_image_h, len(self._image_history))
-            
-            for filename, i in self._image_history.items():
-                with Image.open(filename, mode = "r") as img:
-                    w, h = img.size
-                    img = img.convert("RGBA")
-                    img_data = bytes(img.tobytes())
-                    glTexSubImage3D(GL_TEXTURE_2D_ARRAY, 0, 
-                                    0, 0, i, 
-                                    w, h, 1,
-                                    GL_RGBA,GL_UNSIGNED_BYTE,img_data)
-            
-            glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_WRAP_R, GL_REPEAT)
-            glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_WRAP_S, GL_REPEAT)
-            glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_WRAP_T, GL_REPEAT)
-            glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
-            glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+            glBindTexture(GL_TEXTURE_2D, self._image_gl_id)
+            glTexStorage2D(GL_TEXTURE_2D, 1, GL_RGBA8, atlas_w, atlas_h)
+
+            #stage every image through one pixel unpack buffer, rather
+            #than handing the driver a fresh client pointer per image
+            upload_atlas_images(self._image_history.values(), offsets)
+
+            #the bytes are staged on the GPU now: drop the CPU copies
+            #rather than holding every decoded texture for the process
+            #lifetime
+            for filename, (i, w, h, _) in self._image_history.items():
+                self._image_history[filename] = (i, w, h, None)
+
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+
+            #normalized uv rect per image, fetched by object type in
+            #the vertex shader
+            rects = np.empty((len(dims), 4), dtype=np.float32)
+            rects[:, 0:2] = np.asarray(offsets, dtype=np.float32)
+            rects[:, 2:4] = np.asarray(dims, dtype=np.float32)
+            rects /= (atlas_w, atlas_h, atlas_w, atlas_h)
+            self._uv_rect_buffer = glGenBuffers(1)
+            glBindBuffer(GL_TEXTURE_BUFFER, self._uv_rect_buffer)
+            glBufferData(GL_TEXTURE_BUFFER, rects.nbytes, rects, GL_STATIC_DRAW)
+            self._uv_rect_texture = glGenTextures(1)
+            glActiveTexture(GL_TEXTURE1)
+            glBindTexture(GL_TEXTURE_BUFFER, self._uv_rect_texture)
+            glTexBuffer(GL_TEXTURE_BUFFER, GL_RGBA32F, self._uv_rect_buffer)
+            glActiveTexture(GL_TEXTURE0)
 
         vertex_src = """
 #version 330
-uniform vec4 screenSize_maxSize;
-layout(location=0) in vec2 imageSize;
-layout(location=1) in float objectType;
-layout(location=2) in vec2 center;
-layout(location=3) in float scale;
-layout(location=4) in float rotation;
-
-out vec3 fragTexCoord;
-
-const vec2[4] coords = vec2[](
-    vec2(-1, -1),
-    vec2( 1, -1),
-    vec2( 1,  1),
-    vec2(-1,  1));
+layout(std140) uniform Globals {
+    vec4 screenSize_maxSize;
+};
+uniform samplerBuffer uvRects;
+//imageSize.xy, objectType, scale
+layout(location=0) in vec4 sizeTypeScale;
+//center.xy, cos(rotation), sin(rotation)
+layout(location=1) in vec4 centerRotCS;
+layout(location=2) in vec2 quadPos;
+layout(location=3) in vec2 quadUV;
+
+out vec2 fragTexCoord;
 
 void main() {
-    vec2 pos = coords[gl_VertexID];
+    vec2 pos = quadPos;
 
     //scale
-    pos.x = imageSize.x * scale * pos.x;
-    pos.y = imageSize.y * scale * pos.y;
-
-    //rotate
-    float c = cos(radians(rotation));
-    float s = sin(radians(rotation));
-    float x = pos.x * c - pos.y * s;
-    float y = pos.x * s + pos.y * c;
+    pos.x = sizeTypeScale.x * sizeTypeScale.w * pos.x;
+    pos.y = sizeTypeScale.y * sizeTypeScale.w * pos.y;
+
+    //rotate (cos/sin precomputed on the CPU)
+    float x = pos.x * centerRotCS.z - pos.y * centerRotCS.w;
+    float y = pos.x * centerRotCS.w + pos.y * centerRotCS.z;
     pos.x = x;
     pos.y = y;
 
     //translate
-    pos = pos + center;
+    pos = pos + centerRotCS.xy;
 
     //convert to NDC
     //pos = (pos - screenSize_maxSize.xy);
@@ -178,19 +223,16 @@ void main() {
 
     gl_Position = vec4(pos, 0.0, 1.0);
 
-    pos = 0.5 * (coords[gl_VertexID] + vec2(1.0));
-    pos.x = pos.x * imageSize.x / screenSize_maxSize.z;
-    pos.y = pos.y * imageSize.y / screenSize_maxSize.w;
-    pos.y = pos.y * -1;
-    fragTexCoord = vec3(pos, objectType);
+    vec4 rect = texelFetch(uvRects, int(sizeTypeScale.z));
+    fragTexCoord = rect.xy + quadUV * rect.zw;
 }
 """
 
         fragment_src = """
 #version 330
-uniform sampler2DArray material;
+uniform sampler2D material;
 
-in vec3 fragTexCoord;
+in vec2 fragTexCoord;
 
 out vec4 color;
 
@@ -210,75 +252,165 @@ void main() {
         )
         self._dummy_vao = glGenVertexArrays(1)
         glBindVertexArray(self._dummy_vao)
-        self._shader = create_shader_program(info)
+        self._shader = create_shader_program_cached(info)
         glUseProgram(self._shader)
-        self._global_info_location = glGetUniformLocation(self._shader, "screenSize_maxSize")
+        glUniform1i(glGetUniformLocation(self._shader, "material"), 0)
+        glUniform1i(glGetUniformLocation(self._shader, "uvRects"), 1)
+
+        #globals live in a UBO, rewritten only when the framebuffer
+        #actually changes size — never per frame
+        glUniformBlockBinding(
+            self._shader,
+            glGetUniformBlockIndex(self._shader, "Globals"), 0)
+        self._global_ubo = glGenBuffers(1)
+        glBindBuffer(GL_UNIFORM_BUFFER, self._global_ubo)
+        glBufferData(GL_UNIFORM_BUFFER, 16, None, GL_STATIC_DRAW)
+        glBindBufferBase(GL_UNIFORM_BUFFER, 0, self._global_ubo)
+
+        w, h = glfw.get_framebuffer_size(window)
+        self._update_globals(window, w, h)
+        glfw.set_framebuffer_size_callback(window, self._update_globals)
+
+    def _update_globals(self, window, width: int, height: int) -> None:
+        """
+            Recompute the global shader constants for a framebuffer
+            size. Registered as the framebuffer resize callback.
+        """
 
-        w,h = glfw.get_framebuffer_size(window)
-        global_info = np.array((w / 2, h / 2, self._max_image_w / 2, self._max_image_h / 2), dtype=np.uint32)
-        glUniform4fv(self._global_info_location, 1, global_info)
+        global_info = np.array(
+            (width * 0.5, height * 0.5,
+             self._max_image_w * 0.5, self._max_image_h * 0.5),
+            dtype=np.float32)
+        glBindBuffer(GL_UNIFORM_BUFFER, self._global_ubo)
+        glBufferSubData(
+            GL_UNIFORM_BUFFER, 0, global_info.nbytes, global_info)
 
     def start_drawing(self) -> None:
         """
             Perform any necessary setup before receiving draw commands
         """
 
-        glClear(GL_COLOR_BUFFER_BIT | GL_STENCIL_BUFFER_BIT)
+        if self._clear_on_frame:
+            self._gl_clear(GL_COLOR_BUFFER_BIT | GL_STENCIL_BUFFER_BIT)
+        else:
+            #the stencil test depends on a fresh stencil buffer even
+            #when the color clear is skipped
+            self._gl_clear(GL_STENCIL_BUFFER_BIT)
+
+    def _pack_instances(self, buffer: np.ndarray,
+                        object_types: np.ndarray,
+                        x: np.ndarray, y: np.ndarray,
+                        scale: np.ndarray, rotation: np.ndarray,
+                        size: int) -> None:
+        """
+            Interleave a sprite group's SoA arrays into buffer, a
+            structured INSTANCE_DTYPE view — typically mapped GPU
+            memory, so the packed bytes are written exactly once.
+        """
 
-    def register_sprite_group(self, object_types: np.ndarray, 
-                              transforms: np.ndarray, size: int) -> None:
-        
-        buffer = np.zeros(7 * size, np.float32)
-        for i in range(size):
-            read_pos = size - 1 - i
-            write_pos = 7 * i
-            object_type = object_types[read_pos]
-            #image size: x
-            buffer[write_pos]       = self._image_sizes[2*object_type]
-            #image size: y
-            buffer[write_pos + 1]   = self._image_sizes[2*object_type + 1]
-            buffer[write_pos + 2]   = object_type
-
-            #center: x
-            buffer[write_pos + 3]   = transforms[4*read_pos]
-            #center: y
-            buffer[write_pos + 4]   = transforms[4*read_pos + 1]
-            #scale
-            buffer[write_pos + 5]   = transforms[4*read_pos + 2]
-            #rotation
-            buffer[write_pos + 6]   = transforms[4*read_pos + 3]
-        
+        types = object_types[:size]
+        #image size: x,y (gathered per sprite from the loaded image sizes)
+        buffer["size"] = self._image_sizes_f32()[types]
+        buffer["type"] = types
+        #each source array is contiguous, so these are straight memcpys
+        center = buffer["center"]
+        center[:, 0] = x[:size]
+        center[:, 1] = y[:size]
+        buffer["scale"] = scale[:size]
+        #one cos/sin pair per sprite here beats recomputing them for
+        #every vertex of every instance in the shader
+        angles = np.deg2rad(rotation[:size])
+        rot = buffer["rotation"]
+        rot[:, 0] = np.cos(angles)
+        rot[:, 1] = np.sin(angles)
+
+    def _pack_into_mapped_vbo(self, object_types: np.ndarray,
+                              x: np.ndarray, y: np.ndarray,
+                              scale: np.ndarray, rotation: np.ndarray,
+                              size: int) -> None:
+        """
+            Write a sprite group's packed instance data straight into
+            the bound VBO through a write-only map, skipping the
+            intermediate CPU-side staging array glBufferData would
+            need.
+        """
+
+        #an empty group has nothing to pack, and a zero-length
+        #glMapBufferRange is an error rather than a no-op
+        if size == 0:
+            return
+        view = map_buffer_as_array(
+            GL_ARRAY_BUFFER, size * 16,
+            GL_MAP_WRITE_BIT | GL_MAP_INVALIDATE_BUFFER_BIT,
+            INSTANCE_DTYPE)
+        self._pack_instances(
+            view, object_types, x, y, scale, rotation, size)
+        glUnmapBuffer(GL_ARRAY_BUFFER)
+
+    def register_sprite_group(self, object_types: np.ndarray,
+                              x: np.ndarray, y: np.ndarray,
+                              scale: np.ndarray, rotation: np.ndarray,
+                              size: int) -> int:
+
+        #one VAO and VBO per group, created here and kept for the
+        #group's lifetime: re-inscribing goes through
+        #update_sprite_group and never respecifies the attributes
         VAO = glGenVertexArrays(1)
         glBindVertexArray(VAO)
         VBO = glGenBuffers(1)
         glBindBuffer(GL_ARRAY_BUFFER, VBO)
 
-        glBufferData(GL_ARRAY_BUFFER, size * 28, buffer, GL_STATIC_DRAW)
+        #at least one slot, so the store always matches the group's
+        #recorded capacity even when it is registered empty
+        glBufferData(
+            GL_ARRAY_BUFFER, max(size, 1) * 16, None, GL_DYNAMIC_DRAW)
+        self._pack_into_mapped_vbo(
+            object_types, x, y, scale, rotation, size)
 
-        glVertexAttribPointer(0, 2, GL_FLOAT, GL_FALSE, 28, ctypes.c_void_p(0))
+        #two vec4 fetches cover the whole 16 byte instance
+        glVertexAttribPointer(0, 4, GL_HALF_FLOAT, GL_FALSE, 16, ctypes.c_void_p(0))
         glEnableVertexAttribArray(0)
         glVertexAttribDivisor(0,1)
 
-        glVertexAttribPointer(1, 1, GL_FLOAT, GL_FALSE, 28, ctypes.c_void_p(8))
+        glVertexAttribPointer(1, 4, GL_HALF_FLOAT, GL_FALSE, 16, ctypes.c_void_p(8))
         glEnableVertexAttribArray(1)
         glVertexAttribDivisor(1,1)
 
-        glVertexAttribPointer(2, 2, GL_FLOAT, GL_FALSE, 28, ctypes.c_void_p(12))
+        #per-vertex corners of the shared unit quad
+        glBindBuffer(GL_ARRAY_BUFFER, self._quad_vbo)
+        glVertexAttribPointer(2, 2, GL_FLOAT, GL_FALSE, 16, ctypes.c_void_p(0))
         glEnableVertexAttribArray(2)
-        glVertexAttribDivisor(2,1)
-
-        glVertexAttribPointer(3, 1, GL_FLOAT, GL_FALSE, 28, ctypes.c_void_p(20))
+        glVertexAttribPointer(3, 2, GL_FLOAT, GL_FALSE, 16, ctypes.c_void_p(8))
         glEnableVertexAttribArray(3)
-        glVertexAttribDivisor(3,1)
-
-        glVertexAttribPointer(4, 1, GL_FLOAT, GL_FALSE, 28, ctypes.c_void_p(24))
-        glEnableVertexAttribArray(4)
-        glVertexAttribDivisor(4,1)
 
         id = len(self._sprite_groups)
-        self._sprite_groups.append((VAO, VBO, size))
+        #capacity at least 1, so a group registered empty can still
+        #double its way up when update_sprite_group grows it
+        self._sprite_groups.append((VAO, VBO, size, max(size, 1)))
         return id
 
+    def update_sprite_group(self, id: int, object_types: np.ndarray,
+                            x: np.ndarray, y: np.ndarray,
+                            scale: np.ndarray, rotation: np.ndarray,
+                            size: int) -> None:
+        """
+            Rewrite a registered sprite group's instance data in place,
+            reusing its VAO and VBO. The VBO is only reallocated
+            (orphaned to a larger store) when the group outgrows it.
+        """
+
+        VAO, VBO, _, gpu_capacity = self._sprite_groups[id]
+
+        glBindBuffer(GL_ARRAY_BUFFER, VBO)
+        if size > gpu_capacity:
+            while gpu_capacity < size:
+                gpu_capacity *= 2
+            glBufferData(
+                GL_ARRAY_BUFFER, gpu_capacity * 16, None, GL_DYNAMIC_DRAW)
+        self._pack_into_mapped_vbo(
+            object_types, x, y, scale, rotation, size)
+        self._sprite_groups[id] = (VAO, VBO, size, gpu_capacity)
+
     def draw_sprite_group(self, id: int) -> None:
         """
             Draw a set of sprites.
@@ -292,15 +424,15 @@ void main() {
                 count: how many sprites to draw from the group
         """
 
-        VAO, _ ,size = self._sprite_groups[id]
+        VAO, _, size, _ = self._sprite_groups[id]
         glBindVertexArray(VAO)
-        glDrawArraysInstanced(GL_TRIANGLE_FAN, 0, 4, size)
+        glDrawArraysInstanced(GL_TRIANGLE_STRIP, 0, 4, size)
 
     def finish_drawing(self, window) -> None:
         """
-            Called once per frame to draw stuff.
-            Override this function to make your game draw things.
+            Called once per frame after all draw commands are recorded.
         """
 
-        glFlush()
-        #glfw.swap_buffers(window)
+        #the swap is the frame's one submission point: the driver can
+        #overlap the next frame's work with this one's scanout
+        glfw.swap_buffers(window)
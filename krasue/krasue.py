@@ -1,15 +1,41 @@
+import threading
+import time
+
 import glfw
 import glfw.GLFW as GLFW_CONSTANTS
 from PIL import Image
 import numpy as np
 import krasue.backends.opengl.modern as ogl_modern
 import krasue.backends.opengl.azdo as ogl_azdo
+from krasue._kernels import sprite_add, sprite_remove
 
 BACKEND_AZDO_OGL = 0
 BACKEND_MODERN_OGL = 1
 
 RENDER_BEHAVIOR_EACH_FRAME = 0
 RENDER_BEHAVIOR_CONSERVATIVE = 1
+RENDER_BEHAVIOR_THREADED = 2
+
+#color channel byte -> float, computed once at import so
+#set_clear_color does three clamped lookups instead of divisions
+_U8_TO_F = tuple(i / 255 for i in range(256))
+
+#glfw constants used in hot paths, resolved to plain module-level ints
+#once at import instead of cross-module attribute chains per use
+_KEY_ESCAPE = GLFW_CONSTANTS.GLFW_KEY_ESCAPE
+_PRESS = GLFW_CONSTANTS.GLFW_PRESS
+_TRUE = GLFW_CONSTANTS.GLFW_TRUE
+_ICONIFIED = GLFW_CONSTANTS.GLFW_ICONIFIED
+
+def _close_on_escape(window, key, scancode, action, mods) -> None:
+    """
+        Key callback: ask the window to close when escape is pressed.
+        Event driven, so the render loop doesn't poll key state every
+        frame.
+    """
+
+    if (key == _KEY_ESCAPE and action == _PRESS):
+        glfw.set_window_should_close(window, _TRUE)
 
 class Invocation:
     """
@@ -17,13 +43,16 @@ class Invocation:
         More or less creates a window and rendering backend,
         and gives slots for behavior extension.
     """
-    __slots__ = ("_window", "_renderer")
+    __slots__ = (
+        "_window", "_renderer", "_behavior", "_dirty", "_frametime",
+        "_clear_rgba", "_iconified", "delta", "event_time")
 
     
     def __init__(self, width: int, height: int, 
                  title: str = "A spooky window",
                  backend: int = BACKEND_AZDO_OGL,
-                 behavior: int = RENDER_BEHAVIOR_EACH_FRAME):
+                 behavior: int = RENDER_BEHAVIOR_EACH_FRAME,
+                 clear_on_frame: bool = True):
         """
             Invoke a krasue (very spooky, your exorcism license is
             up to date, right?)
@@ -40,19 +69,44 @@ class Invocation:
                 behavior: how hard to push the renderer.
                     Current options are to draw every frame
                     (good for understanding compute power, but
-                    clogs the GPU with non-useful work)
-                    or to render conservatively
+                    clogs the GPU with non-useful work),
+                    to render conservatively
                     (reduces non-visible renders, frees up CPU time
-                    on main thread)
+                    on main thread),
+                    or to render on a dedicated thread
+                    (input spikes on the main thread no longer stall
+                    rendering, and vice versa — though on_update and
+                    on_draw then run off the main thread, so they must
+                    not make main-thread-only glfw calls such as
+                    set_title)
+
+                clear_on_frame: whether to clear the screen at the
+                    start of each frame. Games which overdraw every
+                    pixel anyway can pass False and save the
+                    bandwidth.
         """
-        
-        if (backend == BACKEND_AZDO_OGL and behavior == RENDER_BEHAVIOR_EACH_FRAME):
+
+        self.delta = 0.0
+        self.event_time = 0.0
+        self._behavior = behavior
+        self._dirty = True
+        self._iconified = False
+        #longest the conservative loop will sleep in the event wait
+        #before waking to run on_update anyway
+        self._frametime = 1 / 60
+        #reused for every set_clear_color call, so color fades and
+        #flashes allocate nothing per frame
+        self._clear_rgba = np.array((0.0, 0.0, 0.0, 1.0), dtype=np.float32)
+
+        if (backend == BACKEND_AZDO_OGL):
             self._renderer = ogl_azdo.Renderer()
-            self._window = self._renderer.setup(width, height, title)
-        if (backend == BACKEND_MODERN_OGL and behavior == RENDER_BEHAVIOR_EACH_FRAME):
+        else:
             self._renderer = ogl_modern.Renderer()
-            self._window = self._renderer.setup(width, height, title)
-        
+        self._window = self._renderer.setup(width, height, title)
+        self._renderer.set_clear_on_frame(clear_on_frame)
+        glfw.set_key_callback(self._window, _close_on_escape)
+        glfw.set_window_refresh_callback(self._window, self._on_refresh)
+
         self.on_setup()
         self._renderer.after_setup(self._window)
 
@@ -89,15 +143,19 @@ class Invocation:
                     channel is an integer in the range [0, 255]
         """
 
-        color = (
-            min(1.0, max(0.0, color[0] / 255)), 
-            min(1.0, max(0.0, color[1] / 255)), 
-            min(1.0, max(0.0, color[2] / 255)), 1.0)
-        self._renderer.set_clear_color(color)
+        #out-of-range channels clamp rather than wrap, so 256 still
+        #means full intensity like the pre-lookup-table code
+        rgba = self._clear_rgba
+        rgba[0] = _U8_TO_F[min(max(int(color[0]), 0), 255)]
+        rgba[1] = _U8_TO_F[min(max(int(color[1]), 0), 255)]
+        rgba[2] = _U8_TO_F[min(max(int(color[2]), 0), 255)]
+        self._renderer.set_clear_color(rgba)
     
     def set_title(self, title: str) -> None:
         """
-            Set the title in the window's titlebar.
+            Set the title in the window's titlebar. Main thread only:
+            with RENDER_BEHAVIOR_THREADED this must not be called from
+            on_update or on_draw.
 
             Parameters:
 
@@ -111,26 +169,160 @@ class Invocation:
             Start the game's main loop.
         """
 
-        while (not glfw.window_should_close(self._window)):
+        if (self._behavior == RENDER_BEHAVIOR_THREADED):
+            self._run_threaded()
+            return
+
+        #hoist glfw lookups out of the loop: resolving module attributes
+        #every frame is pure interpreter overhead
+        window = self._window
+        poll_events = glfw.poll_events
+        wait_events = glfw.wait_events_timeout
+        get_window_attrib = glfw.get_window_attrib
+        should_close = glfw.window_should_close
+        ICONIFIED = _ICONIFIED
+        conservative = self._behavior == RENDER_BEHAVIOR_CONSERVATIVE
+        frametime = self._frametime
+        on_update = self.on_update
+        on_draw = self.on_draw
+        start_drawing = self._renderer.start_drawing
+        finish_drawing = self._renderer.finish_drawing
+        #perf_counter is monotonic and cheaper than time.time, and
+        #measuring here means on_update can just read self.delta
+        perf_counter = time.perf_counter
+        last_time = perf_counter()
+
+        while (not should_close(window)):
+
+            #glfw drains the whole event queue in one call, so a hard
+            #per-frame cap isn't possible; measure it instead and
+            #publish the cost so on_update can adapt its own workload
+            poll_start = perf_counter()
+            if (conservative):
+                #sleep until input arrives (or the timeout elapses),
+                #instead of burning a core spinning on poll
+                wait_events(frametime)
+            else:
+                poll_events()
+            self.event_time = perf_counter() - poll_start
+
+            current_time = perf_counter()
+            self.delta = current_time - last_time
+            last_time = current_time
+
+            on_update()
+
+            if (get_window_attrib(window, ICONIFIED)):
+                continue
+            if (conservative and not self._dirty):
+                continue
+            self._dirty = False
+
+            start_drawing()
+            on_draw()
+            finish_drawing(window)
+
+    def _run_threaded(self) -> None:
+        """
+            Drive rendering from a worker thread while the main thread
+            sleeps in the platform event wait. GLFW insists on event
+            processing happening on the main thread, but the GL
+            context is free to move — so rendering moves instead.
+
+            Note that on_update and on_draw then run off the main
+            thread, so they must not make main-thread-only glfw calls
+            (set_title among them).
+        """
 
-            if (glfw.get_key(
-                self._window, 
-                GLFW_CONSTANTS.GLFW_KEY_ESCAPE) == GLFW_CONSTANTS.GLFW_PRESS):
+        window = self._window
+        #window attribute queries are main-thread-only, so the render
+        #thread reads a flag mirrored by this callback instead
+        glfw.set_window_iconify_callback(window, self._on_iconify)
+        #the context must be current on exactly one thread
+        glfw.make_context_current(None)
+        render_thread = threading.Thread(
+            target = self._render_loop, daemon = True)
+        render_thread.start()
 
-                glfw.set_window_should_close(self._window, GLFW_CONSTANTS.GLFW_TRUE)
-            
-            glfw.poll_events()
+        wait_events = glfw.wait_events_timeout
+        should_close = glfw.window_should_close
+        frametime = self._frametime
+
+        while (not should_close(window)):
+
+            wait_events(frametime)
+
+        render_thread.join()
+
+    def _on_refresh(self, window) -> None:
+        """
+            Window refresh callback: the system reports the contents
+            as damaged (eg. the window was obscured then exposed), so
+            mark the screen dirty. Without this the conservative loop
+            would keep showing a stale back buffer until application
+            code happened to call invalidate.
+        """
+
+        self._dirty = True
+
+    def _on_iconify(self, window, iconified: int) -> None:
+        """
+            Window iconify callback: mirror the minimized state into a
+            flag the render thread can read, since
+            glfw.get_window_attrib may only be called from the main
+            thread.
+        """
+
+        self._iconified = bool(iconified)
+
+    def _render_loop(self) -> None:
+        """
+            The worker half of threaded behavior: update and draw
+            until the window is asked to close.
+        """
+
+        window = self._window
+        glfw.make_context_current(window)
+
+        should_close = glfw.window_should_close
+        on_update = self.on_update
+        on_draw = self.on_draw
+        start_drawing = self._renderer.start_drawing
+        finish_drawing = self._renderer.finish_drawing
+        perf_counter = time.perf_counter
+        last_time = perf_counter()
+
+        while (not should_close(window)):
 
-            self.on_update()
+            current_time = perf_counter()
+            self.delta = current_time - last_time
+            last_time = current_time
 
-            self._renderer.start_drawing()
-            self.on_draw()
-            self._renderer.finish_drawing(self._window)
+            on_update()
+
+            if (self._iconified):
+                continue
+
+            start_drawing()
+            on_draw()
+            finish_drawing(window)
+
+    def invalidate(self) -> None:
+        """
+            Request a redraw. Only needed with
+            RENDER_BEHAVIOR_CONSERVATIVE, where nothing is drawn until
+            something declares the screen contents out of date.
+        """
+
+        self._dirty = True
+        glfw.post_empty_event()
 
     def on_update(self) -> None:
         """
             Called once per frame to update stuff (and things).
             Override this function to implement your game's update behavior.
+            The time (in seconds) since the last frame is available as
+            self.delta, no need to query the clock yourself.
         """
 
         pass
@@ -149,7 +341,7 @@ class SpriteGroup:
         of different types.
     """
     __slots__ = (
-        "_renderer", "_object_types", "_transforms",
+        "_renderer", "_object_types", "_x", "_y", "_scale", "_rot",
         "_size", "_capacity", "_id")
 
     
@@ -178,11 +370,19 @@ class SpriteGroup:
         
         self._renderer = invocation._renderer
         
-        self._object_types = np.zeros(1, dtype=np.uint32)
-        self._transforms = np.zeros(4, dtype=np.float32)
+        #uninitialized storage: only the first _size slots are ever
+        #read, so zeroing the rest would be wasted work.
+        #One array per attribute (structure of arrays): bulk operations
+        #that touch a single attribute then run over contiguous memory
+        self._object_types = np.empty(64, dtype=np.uint32)
+        self._x = np.empty(64, dtype=np.float32)
+        self._y = np.empty(64, dtype=np.float32)
+        self._scale = np.empty(64, dtype=np.float32)
+        self._rot = np.empty(64, dtype=np.float32)
 
         self._size = 0
-        self._capacity = 1
+        self._capacity = 64
+        self._id = -1
     
     def add(self, object_type: int, 
             x: float = 0.0, y: float = 0.0, 
@@ -208,35 +408,96 @@ class SpriteGroup:
 
         #resize if needed
         if self._size >= self._capacity:
-            new_object_types = np.zeros(self._capacity * 2, dtype=np.uint32)
-            new_object_types[0:self._size] = self._object_types[:]
-            self._object_types = new_object_types
-
-            new_transforms = np.zeros(self._capacity * 8, dtype=np.float32)
-            new_transforms[0:self._size * 4] = self._transforms[:]
-            self._transforms = new_transforms
+            self._reserve(self._capacity * 2)
 
-            self._capacity = len(self._object_types)
-        
-        #insert
-        self._object_types[i] = object_type
-        self._transforms[4 * i] = x
-        self._transforms[4 * i + 1] = y
-        self._transforms[4 * i + 2] = scale
-        self._transforms[4 * i + 3] = rotate
+        #insert (compiled with numba when available)
+        sprite_add(
+            self._object_types, self._x, self._y, self._scale,
+            self._rot, i, object_type, x, y, scale, rotate)
         self._size += 1
 
         return i
 
+    def add_batch(self, object_types: np.ndarray,
+                  transforms: np.ndarray) -> int:
+        """
+            Adds many sprites to this group in one go. Much faster than
+            calling add in a loop, the new sprites are copied in with a
+            couple of bulk array assignments.
+
+            Parameters:
+
+                object_types: the image index for each new sprite
+
+                transforms: array of shape (count, 4), one
+                    (x, y, scale, rotate) row per new sprite
+
+            Returns:
+
+                The index of the first added sprite, the rest follow
+                contiguously.
+        """
+
+        count = len(object_types)
+        start = self._size
+        end = start + count
+
+        if end > self._capacity:
+            new_capacity = self._capacity * 2
+            while new_capacity < end:
+                new_capacity *= 2
+            self._reserve(new_capacity)
+
+        transforms = np.asarray(transforms, dtype=np.float32)
+        self._object_types[start:end] = object_types
+        self._x[start:end] = transforms[:, 0]
+        self._y[start:end] = transforms[:, 1]
+        self._scale[start:end] = transforms[:, 2]
+        self._rot[start:end] = transforms[:, 3]
+        self._size = end
+
+        return start
+
+    def _reserve(self, capacity: int) -> None:
+        """
+            grow the backing arrays to the given capacity.
+        """
+
+        size = self._size
+
+        new_object_types = np.empty(capacity, dtype=np.uint32)
+        new_object_types[0:size] = self._object_types[0:size]
+        self._object_types = new_object_types
+
+        self._x = self._grown(self._x, capacity)
+        self._y = self._grown(self._y, capacity)
+        self._scale = self._grown(self._scale, capacity)
+        self._rot = self._grown(self._rot, capacity)
+
+        self._capacity = capacity
+
+    def _grown(self, old: np.ndarray, capacity: int) -> np.ndarray:
+        """
+            a float32 array of the given capacity, holding the used
+            portion of old.
+        """
+
+        new = np.empty(capacity, dtype=np.float32)
+        new[0:self._size] = old[0:self._size]
+        return new
+
     def remove(self, i: int):
         """
-            destroys the sprite at index i, maintains the order of the
-            other sprites in the group.
+            destroys the sprite at index i by moving the last sprite
+            into its slot, so removal is constant time. Note that the
+            last sprite in the group takes index i as a result.
         """
-        
-        np.delete(self._object_types, i)
-        np.delete(self._transforms, np.s_[4 * i : 4 * (i + 1)])
-        self._size -= 1
+
+        last = self._size - 1
+        sprite_remove(
+            self._object_types, self._x, self._y, self._scale,
+            self._rot, i, last)
+        self._size = last
 
     def draw(self) -> None:
         """
@@ -248,8 +509,17 @@ class SpriteGroup:
     def inscribe(self) -> None:
         """
             Register this sprite group with the renderer, duplicates info and uploads
-            it to the GPU.
+            it to the GPU. Calling inscribe again after modifying the
+            group re-uploads the data into the GPU resources created
+            the first time, growing them when the group gained
+            sprites.
         """
 
-        self._id = self._renderer.register_sprite_group(
-            self._object_types, self._transforms, self._size)
\ No newline at end of file
+        if self._id < 0:
+            self._id = self._renderer.register_sprite_group(
+                self._object_types, self._x, self._y,
+                self._scale, self._rot, self._size)
+        else:
+            self._renderer.update_sprite_group(
+                self._id, self._object_types, self._x, self._y,
+                self._scale, self._rot, self._size)
\ No newline at end of file